@@ -9,6 +9,8 @@
 #     github.com/wbolster/plyvel or
 #     pypi.org/project/plyvel-wheels
 #     www.microsoft.com/en-us/download/details.aspx?id=48145
+# Optional: uses Python module 'orjson' for faster JSON decode if installed
+#     pypi.org/project/orjson
 #
 # Version: 0.0.1 (pre-alpha)
 # Powered by ChatGPT
@@ -25,8 +27,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
 import urllib.request
 import subprocess
+import functools
 import importlib
 import platform
 import tempfile
@@ -39,9 +43,32 @@ import sys
 import os
 import re
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+user_site = None
 
-# function check for python package
+# LevelDB key layout: _THEIA_PREFIX + [sketch + ':'] + _CONFIG_SUFFIX_TMPL.format(board)
+_THEIA_PREFIX = b'_file://\x00\x01theia:'
+_CONFIG_SUFFIX_TMPL = '.arduinoIDE-configOptions-{}'
+
+
+# function parse JSON struct from utf-8 bytes, using orjson if available
+# (read-and-print only: orjson turns integers beyond 64 bits into floats)
+def json_loads(payload):
+    if orjson:
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN/Infinity, json does not
+            pass
+    return json.loads(payload)
+
+
+# function check for python package (memoized)
+@functools.lru_cache(maxsize=None)
 def package_installed(package_name):
     try:
         __import__(package_name)
@@ -84,24 +111,37 @@ def install_pip():
         sys.exit(1)
 
 
+# function get user-site directory (queried once)
+def get_user_site():
+    global user_site
+    if user_site is None:
+        user_site = subprocess.check_output([sys.executable, "-m", "site", "--user-site"], text=True).strip()
+    return user_site
+
+
 # function import python module if not installed
 def import_module(package_name):
     module_name = package_name.split('-')[0]
-    if package_installed(module_name):
+    if module_name in sys.modules:
+        globals()[module_name] = sys.modules[module_name]
+    elif package_installed(module_name):
         globals()[module_name] = importlib.import_module(module_name)
     else:
         install_pip()
         install_package(package_name)
-        # add user-site directory to path
-        user_site = subprocess.check_output([sys.executable, "-m", "site", "--user-site"], text=True).strip()
-        if user_site not in sys.path:
-            sys.path.append(user_site)
         try:
             importlib.invalidate_caches()
             globals()[module_name] = importlib.import_module(module_name)
         except ImportError:
-            print(f"Error: module '{package_name}' is not installed properly.")
-            sys.exit(1)
+            # add user-site directory to path
+            if get_user_site() not in sys.path:
+                sys.path.append(get_user_site())
+            try:
+                importlib.invalidate_caches()
+                globals()[module_name] = importlib.import_module(module_name)
+            except ImportError:
+                print(f"Error: module '{package_name}' is not installed properly.")
+                sys.exit(1)
 
 
 # function download sysinternals handle.exe
@@ -155,96 +195,89 @@ def check_dependencies():
         import_module('plyvel-wheels')
 
 
-# function dump whole database to stdout
-def print_table(db_path):
+# function dump database keys matching prefix to stdout (whole database if prefix is None)
+def print_table(db, prefix=_THEIA_PREFIX):
     print(f"{'Key':<40} | {'Value':<40}")
     print("="*85)
-    for key, value in db:
+    for key, value in db.iterator(prefix=prefix, fill_cache=False):
         print(f"{key!r:<40} | {value!r:<40}")
 
 
 # function extract sketch directory path from database key
 def get_sketch(db, board):
-    prefix = b'_file://' + b'\x00' + b'\x01' + f'theia:'.encode('utf-8')
+    prefix = _THEIA_PREFIX
+    suffix = (':' + _CONFIG_SUFFIX_TMPL.format(board)).encode('utf-8')
     sketch_paths = []
-    for key, value in db.iterator(prefix=prefix):
-        key_str = key.decode('utf-8')
-        if f".arduinoIDE-configOptions-{board}" in key_str:
-            start = key_str.find('theia:') + len('theia:')
-            end = key_str.find(f":.arduinoIDE-configOptions-{board}")
-            if start != -1 and end != -1 and start < end:
-                sketch = key_str[start:end]
-                sketch_paths.append(sketch)
+    for key in db.iterator(prefix=prefix, include_value=False, fill_cache=False):
+        # match and slice on bytes, decode only the sketch path
+        if key.endswith(suffix) and len(key) > len(prefix) + len(suffix):
+            sketch = key[len(prefix):-len(suffix)].decode('utf-8')
+            sketch_paths.append(sketch)
     if sketch_paths:
         return sketch_paths
     return []
 
 
-# function read whole key-value pair and extract JSON struct from value string
-def read_key(db, key):
-    byte_string = db.get(key)
+# function read whole key-value pair and slice JSON struct from value string
+def read_payload(db, key):
+    byte_string = db.get(key, fill_cache=False)
     if byte_string:
-        decoded_string = byte_string.decode('utf-8')
-        start_index = decoded_string.find('{')
-        end_index = decoded_string.rfind('}')
+        start_index = byte_string.find(b'{')
+        end_index = byte_string.rfind(b'}')
         if start_index != -1 and end_index != -1:
-            try:
-                return json.loads(decoded_string[start_index:end_index + 1])
-            except Exception as e:
-                print(f"Error parsing JSON: {e}")
-                return {}
-    return {}
+            return byte_string[start_index:end_index + 1]
+    return None
 
 
-# function write whole key-value pair into database
-def write_key(db, key, value):
-    try:
-        db.put(key, value)
-    except Exception as e:
-        print(f"Error writing to the database: {e}")
+# function read whole key-value pair and extract JSON struct from value string
+def read_key(db, key, loads=json_loads):
+    payload = read_payload(db, key)
+    if payload:
+        try:
+            return loads(payload)
+        except Exception as e:
+            print(f"Error parsing JSON: {e}")
+            return {}
+    return {}
 
 
-# function read values from PartitionScheme
-def read_value(db, key, json_property, json_option, json_object):
-    data = read_key(db, key)
+# function extract configOptions from parsed JSON struct
+def _extract_property(data, json_property):
     if data:
         properties = data.get(json_property)
         if properties:
-            options = [item for item in properties if item.get("option") == json_option]
-            if options:
-                array_found = False
-                array = []
-                for item in options:
-                    values = item.get("values", [])
-                    for value in values:
-                        if value.get("value") == json_object:
-                            array.append(value)
-                            array_found = True
-                if array_found:
-                    return array
+            return properties
     return []
 
 
+# function extract Partition Schemes from parsed JSON struct
+def _extract_option(data, json_property, json_option):
+    return [item for item in _extract_property(data, json_property) if item.get("option") == json_option]
+
+
+# function extract values of PartitionScheme from parsed JSON struct
+def _extract_value(data, json_property, json_option, json_object):
+    return [value for item in _extract_option(data, json_property, json_option) for value in item.get("values", []) if value.get("value") == json_object]
+
+
+# function write whole key-value pair into database or write batch
+def write_key(writer, key, value):
+    writer.put(key, value)
+
+
+# function read values from PartitionScheme
+def read_value(db, key, json_property, json_option, json_object):
+    return _extract_value(read_key(db, key), json_property, json_option, json_object)
+
+
 # function read all Partition Schemes from configOptions
 def read_object(db, key, json_property, json_option):
-    data = read_key(db, key)
-    if data:
-        properties = data.get(json_property)
-        if properties:
-            options = [item for item in properties if item.get("option") == json_option]
-            if options:
-                return options
-    return []
+    return _extract_option(read_key(db, key), json_property, json_option)
 
 
 # function read configOptions from .arduinoIDE-configOptions
 def read_property(db, key, json_property):
-    data = read_key(db, key)
-    if data:
-        properties = data.get(json_property)
-        if properties:
-            return properties
-    return []
+    return _extract_property(read_key(db, key), json_property)
 
 
 # function read .arduinoIDE-configOptions for board id
@@ -256,98 +289,84 @@ def read_configOptions(db, key):
 
 
 # function set new Partition Scheme
-def write_value(db, key, json_property, json_option, json_object):
-
-    # read value json_object from database
-    json_object_write = read_value(db, key, json_property, json_option, json_object)
-
-    # set selected true
-    if json_object_write:
-        for item in json_object_write:
-            if item.get("value") == json_object:
-                item["selected"] = True
-
-        # read object json_option from database
-        json_option_write = read_object(db, key, json_property, json_option)
-        if json_option_write:
-            # iterate through the values inside the object
-            for item in json_option_write:
-                if item.get("option") == json_option:
-                    for value_item in item["values"]:
-                        value_item["selected"] = False
-                    # insert json_object into json_option
-                    for value_item in item["values"]:
-                        if value_item.get("value") == json_object:
-                            if isinstance(json_object_write[0], dict):
-                                value_item.update(json_object_write[0])
-                                not_written = False
-                            else:
-                                not_written = True
-                            break
-                        else:
-                            not_written = True
-                    if not_written:
-                        print(f"Error: {json_option} '{json_object}' not written")
-                        sys.exit(1)
-
-            # read property json_property from database
-            json_property_write = read_property(db, key, json_property)
-            if json_property_write:
-                # find and update the specific option
-                for item in json_property_write:
-                    if item.get("option") == json_option:
-                        # insert json_option into json_property
-                        item.update(json_option_write[0])
-                        not_written = False
-                        break
-                    else:
-                        not_written = True
-                if not_written:
-                    print(f"Error: {json_property} '{json_option}' not written")
-                    sys.exit(1)
-
-                # read configOptions from database
-                json_configOptions_write = read_configOptions(db, key)
-                if json_configOptions_write:
-                    # insert json_property into configOptions
-                    if json_property in json_configOptions_write:
-                        json_configOptions_write[json_property] = json_property_write
-                    else:
-                        print(f"Error: '{json_property}' not written")
-                        sys.exit(1)
-
-                    # write the key-value pair to the database
-                    encoded_value = b'\x01' + json.dumps(json_configOptions_write).encode('utf-8')
-                    write_key(db, key, encoded_value)
-
-
-# function update database
-def update_database(mode, db, key, json_property, json_option, json_object):
+def write_value(db, key, json_property, json_option, json_object, writer=None):
+
+    # read configOptions from database once, all views below share this tree
+    # parsed with json, not orjson, so large integers are written back unchanged
+    data = read_key(db, key, json.loads)
+
+    # read property json_property from parsed data
+    json_property_write = _extract_property(data, json_property)
+    if not json_property_write:
+        return
+
+    # index options and values by name for direct lookups, first occurrence wins
+    opt_by_name = {item.get("option"): item for item in reversed(json_property_write)}
+    json_option_write = opt_by_name.get(json_option)
+    if json_option_write is None:
+        print(f"Error: {json_property} '{json_option}' not written")
+        sys.exit(1)
+    values = json_option_write.get("values", [])
+    val_by_name = {value.get("value"): value for value in reversed(values)}
+    json_object_write = val_by_name.get(json_object)
+    if json_object_write is None:
+        print(f"Error: {json_option} '{json_object}' not written")
+        sys.exit(1)
+
+    # set selected true for json_object only, in one pass over the values
+    for value in values:
+        value["selected"] = value is json_object_write
+
+    # write the key-value pair to the database
+    encoded_value = b'\x01' + json.dumps(data).encode('utf-8')
+    write_key(writer if writer is not None else db, key, encoded_value)
+
+
+# function read key-value pair depending on the number of calling arguments
+def read_result(db, key, json_property, json_option, json_object):
+    if len(sys.argv) > 6:
+        return read_value(db, key, json_property, json_option, json_object)
+    elif len(sys.argv) > 5:
+        return read_object(db, key, json_property, json_option)
+    elif len(sys.argv) > 4:
+        return read_property(db, key, json_property)
+    return read_configOptions(db, key)
+
+
+# function update database for all given keys
+def update_database(mode, db, keys, json_property, json_option, json_object):
 
     # print the key-value pairs depending on the number of calling arguments
     if mode.lower() in ['r', 'read']:
-        if len(sys.argv) > 6:
-            print(json.dumps(read_value(db, key, json_property, json_option, json_object), indent=2))
-        elif len(sys.argv) > 5:
-            print(json.dumps(read_object(db, key, json_property, json_option), indent=2))
-        elif len(sys.argv) > 4:
-            print(json.dumps(read_property(db, key, json_property), indent=2))
-        elif len(sys.argv) > 3:
-            print(json.dumps(read_configOptions(db, key), indent=2))
+        if len(sys.argv) > 3:
+            # read all keys in parallel from one consistent snapshot, print in key order
+            with db.snapshot() as snapshot, concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(lambda key: read_result(snapshot, key, json_property, json_option, json_object), keys))
+            for result in results:
+                print(json.dumps(result, indent=2))
         else:
-            print_table(db_path)
+            print_table(db)
 
-    # set new Partition Scheme and write back the key-value pair in database
+    # dump whole database to stdout
+    elif mode.lower() in ['d', 'dump']:
+        print_table(db, None)
+
+    # set new Partition Scheme and write back the key-value pairs in database
     elif mode.lower() in ['w', 'write']:
         if len(sys.argv) > 6:
-            write_value(db, key, json_property, json_option, json_object)
+            try:
+                with db.write_batch(transaction=True) as wb:
+                    for key in keys:
+                        write_value(db, key, json_property, json_option, json_object, wb)
+            except Exception as e:
+                print(f"Error writing to the database: {e}")
 
 
 
-# main: usage: script leveldb [r|w] esp32:esp32:esp32 configOptions PartitionScheme custom BlinkRGB
+# main: usage: script leveldb [r|w|d] esp32:esp32:esp32 configOptions PartitionScheme custom BlinkRGB
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: script leveldb [r|w] id property object value [sketch]\n")
+        print("Usage: script leveldb [r|w|d] id property object value [sketch]\n")
         os_type = platform.system()
         if os_type == "Linux":
             print(f'python3 {os.path.basename(sys.argv[0])} ~/.config/arduino-ide/Local\\ Storage/leveldb w esp32:esp32:esp32 configOptions PartitionScheme custom')
@@ -360,13 +379,26 @@ if __name__ == "__main__":
     # install python package
     check_dependencies()
 
-    # ensure the provided path is a directory and exists
+    # parse all calling arguments before opening the database to keep the LOCK short
     db_path       = sys.argv[1]
     mode          = sys.argv[2]
+    board         = sys.argv[3] if len(sys.argv) > 3 else None
+    json_property = sys.argv[4] if len(sys.argv) > 4 else None
+    json_option   = sys.argv[5] if len(sys.argv) > 5 else None
+    json_object   = sys.argv[6] if len(sys.argv) > 6 else None
+    filter_sketch = sys.argv[7] if len(sys.argv) > 7 else None
+
+    # ensure the provided path is a directory and exists
     if not os.path.isdir(db_path):
         print(f"Error: {db_path} is not a LevelDB database")
         sys.exit(1)
 
+    # prepare the sketch filter and the LevelDB database key suffix
+    if filter_sketch is not None:
+        pattern = re.compile(rf"file:///.*?/{re.escape(filter_sketch)}")
+    if board:
+        suffix = _CONFIG_SUFFIX_TMPL.format(board)
+
     # close database blocking file handles (Arduino IDE.exe)
     if platform.system() == "Windows":
         if ctypes.windll.shell32.IsUserAnAdmin():
@@ -381,56 +413,41 @@ if __name__ == "__main__":
         print(f"Error opening LevelDB: {e}")
         sys.exit(1)
 
-    # construct the LevelDB database key
-    if len(sys.argv) > 3:
-        board         = sys.argv[3]
-        sketch_paths  = get_sketch(db, board)
-        if sketch_paths:
-            all_keys = [
-                b'_file://' + b'\x00' + b'\x01' + f'theia:{sketch}:.arduinoIDE-configOptions-{board}'.encode('utf-8')
-                for sketch in sketch_paths
-            ]
-        else:
-            all_keys = [
-                b'_file://' + b'\x00' + b'\x01' + f'theia:.arduinoIDE-configOptions-{board}'.encode('utf-8')
-            ]
-    if len(sys.argv) > 4:
-        json_property = sys.argv[4]
-    if len(sys.argv) > 5:
-        json_option   = sys.argv[5]
-    if len(sys.argv) > 6:
-        json_object   = sys.argv[6]
-    if len(sys.argv) > 7:
-        filter_sketch = sys.argv[7]
-
-    # set new Partition Scheme and write back the key-value pair in database
     try:
-        if filter_sketch and all_keys:
-            # update database sketch specific if sketch name is given
-            matching_keys = []
-            for key in all_keys:
-                key_str = key.decode('utf-8')
-                prefix = "_file://\x00\x01theia"
-                suffix = f".arduinoIDE-configOptions-{board}"
-                if key_str.startswith(prefix) and key_str.endswith(suffix):
-                    start_idx = len(prefix)
-                    end_idx = key_str.find(suffix)
-                    sketch_path = key_str[start_idx:end_idx]
-                    sketch_path = sketch_path.strip(":")
-                    pattern = rf"^file:///.*?/{filter_sketch}$"
-                    if re.search(pattern, sketch_path):
-                        matching_keys.append(key)
-            if matching_keys:
-                for key in matching_keys:
-                    update_database(mode, db, key, json_property, json_option, json_object)
-    except NameError:
-        if 'all_keys' in locals():
-            for key in all_keys:
+        if board:
+            # construct the LevelDB database key
+            sketch_paths = get_sketch(db, board)
+            if sketch_paths:
+                all_keys = [
+                    _THEIA_PREFIX + f'{sketch}:{suffix}'.encode('utf-8')
+                    for sketch in sketch_paths
+                ]
+            else:
+                all_keys = [
+                    _THEIA_PREFIX + suffix.encode('utf-8')
+                ]
+
+            # set new Partition Scheme and write back the key-value pair in database
+            if filter_sketch is not None:
+                # update database sketch specific if sketch name is given
+                matching_keys = []
+                prefix = _THEIA_PREFIX
+                suffix_bytes = suffix.encode('utf-8')
+                for key in all_keys:
+                    if key.startswith(prefix) and key.endswith(suffix_bytes):
+                        sketch_path = key[len(prefix):-len(suffix_bytes)].decode('utf-8')
+                        sketch_path = sketch_path.strip(":")
+                        if pattern.fullmatch(sketch_path):
+                            matching_keys.append(key)
+                if matching_keys:
+                    update_database(mode, db, matching_keys, json_property, json_option, json_object)
+            else:
                 # update database board specific if no sketch is given
-                update_database(mode, db, key, json_property if 'json_property' in locals() else None, json_option if 'json_option' in locals() else None, json_object if 'json_object' in locals() else None)
+                update_database(mode, db, all_keys, json_property, json_option, json_object)
         else:
-            # dump whole database to stdout if no board is given
+            # dump theia keys (r) or whole database (d) to stdout if no board is given
             update_database(mode, db, None, None, None, None)
 
-    # close the database
-    db.close()
+    # close the database, also on error exit
+    finally:
+        db.close()